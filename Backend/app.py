@@ -4,20 +4,29 @@ S3-based architecture: Upload to S3 -> Process on server -> Clips to S3
 """
 import os
 import json
-import re
+import hashlib
+import struct
 import threading
 import subprocess
 import tempfile
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import requests
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.config import Config
+from redis import Redis
+from rq import Queue
 
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
+# Imported after load_dotenv: the shared clients read REDIS_URL at import time
+from http_clients import RANKING_MODEL, TRIAGE_MODEL, deepgram_post, openrouter_post, retry_api
+from llm_json import parse_json_safely
+
 app = Flask(__name__)
 CORS(app)
 
@@ -32,8 +41,62 @@ s3_client = boto3.client(
     config=Config(signature_version='s3v4')
 )
 
-# Global state for tracking progress
-jobs = {}
+# Multipart transfers with parallel byte-range parts for large videos
+boto_transfer_config = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
+
+# Slice size for parallel range GETs in RangedDownload
+RANGE_PART_SIZE = 8 * 1024 * 1024
+
+# Part size for browser multipart uploads; grown for huge files since S3 allows at most 10,000 parts
+UPLOAD_PART_SIZE = 8 * 1024 * 1024
+MAX_UPLOAD_PARTS = 10000
+# Part URLs are presigned in batches as the client needs them, so they can't expire mid-upload
+MAX_PART_URLS_PER_REQUEST = 100
+
+# Job state lives in Redis so every gunicorn worker and RQ worker sees the same jobs
+redis_client = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+job_queue = Queue("videotto", connection=redis_client)
+JOB_TTL = 7 * 86400  # 7 days
+RESULT_CACHE_TTL = 7 * 86400  # Transcripts and clip selections for repeat runs on the same video
+
+def _set_job(job_id: str, **fields):
+    """Update fields of a job. Values are stored JSON-encoded in the job hash."""
+    key = f"job:{job_id}"
+    redis_client.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+    redis_client.expire(key, JOB_TTL)
+
+def _get_job(job_id: str) -> dict:
+    """Load a job, or None if it does not exist."""
+    data = redis_client.hgetall(f"job:{job_id}")
+    if not data:
+        return None
+    return {name.decode(): json.loads(value) for name, value in data.items()}
+
+def _update_job_clip(job_id: str, clip_rank: int, **fields):
+    """
+    Update fields of one clip in a job's result.
+    Runs as a WATCH/MULTI transaction (retried on conflict) so concurrent re-exports don't overwrite each other.
+    """
+    key = f"job:{job_id}"
+    
+    def _update(pipe):
+        raw = pipe.hget(key, "result")
+        if raw is None:
+            return
+        result = json.loads(raw)
+        for clip in result.get("clips", []):
+            if clip["rank"] == clip_rank:
+                clip.update(fields)
+        pipe.multi()
+        pipe.hset(key, "result", json.dumps(result))
+        pipe.expire(key, JOB_TTL)
+    
+    redis_client.transaction(_update, key)
 
 # ============== S3 HELPERS ==============
 
@@ -53,16 +116,63 @@ def get_upload_url(filename: str, content_type: str = "video/mp4") -> dict:
     
     return {"upload_url": presigned_url, "s3_key": key, "content_type": content_type}
 
+def start_multipart_upload(filename: str, file_size: int, content_type: str = "video/mp4") -> dict:
+    """Start a multipart upload and pick a part size that keeps it within S3's part limit."""
+    key = f"uploads/{uuid.uuid4()}/{filename}"
+    
+    upload = s3_client.create_multipart_upload(Bucket=S3_BUCKET, Key=key, ContentType=content_type)
+    
+    # Round up to whole MiB so every part but the last stays the same size
+    min_part_size = -(-file_size // MAX_UPLOAD_PARTS)
+    part_size = max(UPLOAD_PART_SIZE, -(-min_part_size // (1024 * 1024)) * 1024 * 1024)
+    part_count = max(1, -(-file_size // part_size))
+    
+    return {"upload_id": upload["UploadId"], "s3_key": key, "part_size": part_size, "part_count": part_count}
+
+def get_part_upload_urls(s3_key: str, upload_id: str, first_part: int, count: int) -> list:
+    """Generate presigned URLs for parts first_part .. first_part + count - 1."""
+    return [
+        s3_client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': S3_BUCKET,
+                'Key': s3_key,
+                'UploadId': upload_id,
+                'PartNumber': part_number
+            },
+            ExpiresIn=3600  # 1 hour
+        )
+        for part_number in range(first_part, first_part + count)
+    ]
+
+def complete_multipart_upload(s3_key: str, upload_id: str, parts: list):
+    """Assemble uploaded parts ({"ETag", "PartNumber"}) into the final object."""
+    s3_client.complete_multipart_upload(
+        Bucket=S3_BUCKET,
+        Key=s3_key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": sorted(
+            [{"ETag": part["ETag"], "PartNumber": int(part["PartNumber"])} for part in parts],
+            key=lambda part: part["PartNumber"]
+        )}
+    )
+    print(f"[S3] Multipart upload complete: {s3_key} ({len(parts)} parts)")
+
+def abort_multipart_upload(s3_key: str, upload_id: str):
+    """Abort a multipart upload so S3 discards (and stops billing for) its uploaded parts."""
+    s3_client.abort_multipart_upload(Bucket=S3_BUCKET, Key=s3_key, UploadId=upload_id)
+    print(f"[S3] Multipart upload aborted: {s3_key}")
+
 def download_from_s3(s3_key: str, local_path: str):
     """Download file from S3 to local path."""
     print(f"[S3] Downloading {s3_key} to {local_path}")
-    s3_client.download_file(S3_BUCKET, s3_key, local_path)
+    s3_client.download_file(S3_BUCKET, s3_key, local_path, Config=boto_transfer_config)
     print(f"[S3] Download complete: {os.path.getsize(local_path) / (1024*1024):.1f} MB")
 
 def upload_to_s3(local_path: str, s3_key: str) -> str:
     """Upload file from local path to S3."""
     print(f"[S3] Uploading {local_path} to {s3_key}")
-    s3_client.upload_file(local_path, S3_BUCKET, s3_key)
+    s3_client.upload_file(local_path, S3_BUCKET, s3_key, Config=boto_transfer_config)
     
     # Generate presigned URL for download
     url = s3_client.generate_presigned_url(
@@ -73,123 +183,267 @@ def upload_to_s3(local_path: str, s3_key: str) -> str:
     print(f"[S3] Upload complete")
     return url
 
+def upload_stream_to_s3(fileobj, s3_key: str) -> str:
+    """Upload a non-seekable stream to S3, sending multipart parts as the data is produced."""
+    print(f"[S3] Streaming upload to {s3_key}")
+    s3_client.upload_fileobj(fileobj, S3_BUCKET, s3_key, Config=boto_transfer_config)
+    
+    url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': S3_BUCKET, 'Key': s3_key},
+        ExpiresIn=86400  # 24 hours
+    )
+    print(f"[S3] Streaming upload complete: {s3_key}")
+    return url
+
+class RangedDownload:
+    """
+    Download an S3 object with parallel range GETs into a pre-sized local file.
+    Tracks the contiguous prefix on disk so it can be consumed before the download finishes.
+    """
+
+    def __init__(self, s3_key: str, local_path: str, max_workers: int = 8):
+        self.s3_key = s3_key
+        self.local_path = local_path
+        head = s3_client.head_object(Bucket=S3_BUCKET, Key=s3_key)
+        self.size = head["ContentLength"]
+        self.etag = head["ETag"].strip('"')
+        self.num_parts = -(-self.size // RANGE_PART_SIZE)
+        self._done = [False] * self.num_parts
+        self._contiguous = 0
+        self._error = None
+        self._cond = threading.Condition()
+        
+        self._fd = os.open(local_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+        os.ftruncate(self._fd, self.size)
+        
+        print(f"[S3] Downloading {s3_key} to {local_path} ({self.num_parts} parts)")
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        for part in range(self.num_parts):
+            self._executor.submit(self._fetch_part, part)
+
+    def _fetch_part(self, part: int):
+        start = part * RANGE_PART_SIZE
+        end = min(start + RANGE_PART_SIZE, self.size) - 1
+        try:
+            response = s3_client.get_object(Bucket=S3_BUCKET, Key=self.s3_key, Range=f"bytes={start}-{end}")
+            offset = start
+            for chunk in response["Body"].iter_chunks(chunk_size=1024 * 1024):
+                os.pwrite(self._fd, chunk, offset)
+                offset += len(chunk)
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+            return
+        
+        with self._cond:
+            self._done[part] = True
+            while self._contiguous < self.size and self._done[self._contiguous // RANGE_PART_SIZE]:
+                self._contiguous = min(self._contiguous + RANGE_PART_SIZE, self.size)
+            self._cond.notify_all()
+
+    def wait_for(self, offset: int) -> int:
+        """Block until the first `offset` bytes are on disk. Returns bytes available."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._error is not None or self._contiguous >= min(offset, self.size))
+            if self._error is not None:
+                raise self._error
+            return self._contiguous
+
+    def wait(self):
+        """Block until the whole object is on disk."""
+        self.wait_for(self.size)
+        print(f"[S3] Download complete: {self.size / (1024*1024):.1f} MB")
+
+    def iter_bytes(self, chunk_size: int = 1024 * 1024):
+        """Yield the file from the start, in order, as parts arrive."""
+        offset = 0
+        while offset < self.size:
+            available = self.wait_for(offset + chunk_size)
+            data = os.pread(self._fd, min(chunk_size, available - offset), offset)
+            offset += len(data)
+            yield data
+
+    def moov_at_front(self) -> bool:
+        """Walk top-level mp4 boxes: True if moov comes before mdat (readable as a stream)."""
+        offset = 0
+        while offset + 16 <= self.size:
+            self.wait_for(offset + 16)
+            header = os.pread(self._fd, 16, offset)
+            box_size, box_type = struct.unpack(">I4s", header[:8])
+            if box_size == 1:
+                box_size = struct.unpack(">Q", header[8:16])[0]
+            if box_type == b"moov":
+                return True
+            if box_type == b"mdat" or box_size < 8:
+                return False
+            offset += box_size
+        return False
+
+    def close(self):
+        """Cancel pending parts and release the file descriptor."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        os.close(self._fd)
+
 # ============== TRANSCRIPTION ==============
 
-def extract_audio(video_path: str) -> str:
-    """Extract audio from video file for transcription."""
-    audio_path = tempfile.mktemp(suffix=".mp3")
+def _feed_stdin(proc: subprocess.Popen, chunks):
+    """Write chunks to a process's stdin, stopping quietly if it exits early."""
+    try:
+        for chunk in chunks:
+            proc.stdin.write(chunk)
+    except BrokenPipeError:
+        pass
+    except Exception as e:
+        print(f"[Transcription] Input stream error: {e}")
+    finally:
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+
+def _start_with_input(cmd: list, source: RangedDownload = None) -> subprocess.Popen:
+    """Start an ffmpeg/ffprobe command, feeding stdin from the download when one is given."""
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if source else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    if source:
+        threading.Thread(target=_feed_stdin, args=(proc, source.iter_bytes()), daemon=True).start()
+    return proc
+
+def probe_audio_codec(video_path: str, source: RangedDownload = None) -> str:
+    """Return the codec name of the first audio stream, or "" if it can't be determined."""
     cmd = [
-        "ffmpeg", "-y",
-        "-i", video_path,
-        "-vn",
-        "-acodec", "libmp3lame",
-        "-ar", "16000",
-        "-ac", "1",
-        "-b:a", "64k",
-        audio_path
+        "ffprobe", "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "stream=codec_name",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        "pipe:0" if source else video_path
     ]
-    subprocess.run(cmd, capture_output=True)
-    return audio_path
+    proc = _start_with_input(cmd, source)
+    output = proc.stdout.read()
+    proc.stdout.close()
+    proc.wait()
+    return output.decode(errors="ignore").strip()
 
-def transcribe_video(video_path: str) -> dict:
-    """Transcribe video using Deepgram with speaker diarization."""
-    audio_path = extract_audio(video_path)
+def extract_audio(video_path: str, source: RangedDownload = None) -> tuple:
+    """
+    Start ffmpeg extracting audio from video, streamed on the process stdout.
+    AAC sources are remuxed to ADTS without re-encoding; anything else is encoded to Opus.
+    If a download is given, the video is piped in while it is still arriving.
+    Returns (process, content_type).
+    """
+    codec = probe_audio_codec(video_path, source)
+    print(f"[Transcription] Source audio codec: {codec or 'unknown'}")
     
-    audio_size = os.path.getsize(audio_path) / (1024 * 1024)
-    print(f"[Transcription] Audio file size: {audio_size:.1f} MB")
+    if codec == "aac":
+        audio_args = ["-c:a", "copy", "-f", "adts"]
+        content_type = "audio/aac"
+    else:
+        audio_args = ["-c:a", "libopus", "-b:a", "24k", "-ar", "16000", "-ac", "1", "-f", "ogg"]
+        content_type = "audio/ogg"
+    
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", "pipe:0" if source else video_path,
+        "-map", "0:a:0",  # The stream probed above; ffmpeg would otherwise pick the one with most channels
+        *audio_args,
+        "pipe:1"
+    ]
+    return _start_with_input(cmd, source), content_type
+
+DEEPGRAM_PARAMS = {
+    "model": "nova-2",
+    "diarize": "true",
+    "punctuate": "true",
+    "utterances": "true"
+}
+# Part of the transcript cache key, so changing the Deepgram settings invalidates old transcripts
+DEEPGRAM_PARAMS_DIGEST = hashlib.sha256(json.dumps(DEEPGRAM_PARAMS, sort_keys=True).encode()).hexdigest()[:16]
+
+@retry_api
+def _transcribe_once(video_path: str, source: RangedDownload = None) -> dict:
+    """Extract audio and stream it to Deepgram. Retried as a whole, since the body can only be sent once."""
+    proc, content_type = extract_audio(video_path, source)
     
     try:
-        with open(audio_path, "rb") as audio_file:
-            print(f"[Transcription] Sending to Deepgram...")
-            response = requests.post(
-                "https://api.deepgram.com/v1/listen",
-                headers={
-                    "Authorization": f"Token {os.getenv('DEEPGRAM_API_KEY')}",
-                    "Content-Type": "audio/mpeg"
-                },
-                params={
-                    "model": "nova-2",
-                    "diarize": "true",
-                    "punctuate": "true",
-                    "utterances": "true"
-                },
-                data=audio_file,
-                timeout=300
-            )
-        
+        print(f"[Transcription] Streaming audio to Deepgram...")
+        # Chunked upload: audio is sent while ffmpeg is still encoding it
+        response = deepgram_post(
+            headers={
+                "Authorization": f"Token {os.getenv('DEEPGRAM_API_KEY')}",
+                "Content-Type": content_type
+            },
+            params=DEEPGRAM_PARAMS,
+            content=iter(lambda: proc.stdout.read(65536), b""),
+            timeout=300
+        )
         print(f"[Transcription] Deepgram response status: {response.status_code}")
         result = response.json()
-        
-        if "error" in result:
-            print(f"[Transcription] Deepgram error: {result}")
-            return {"segments": []}
-        
-        segments = []
-        utterances = result.get("results", {}).get("utterances", [])
-        print(f"[Transcription] Got {len(utterances)} utterances")
-        
-        for utt in utterances:
-            segments.append({
-                "start": utt["start"],
-                "end": utt["end"],
-                "text": utt["transcript"],
-                "speaker": utt.get("speaker", 0)
-            })
-        
-        return {"segments": segments}
     except Exception as e:
         print(f"[Transcription] Error: {e}")
-        return {"segments": []}
+        if proc.poll() is None:
+            proc.kill()
+        raise
     finally:
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-
-# ============== CLIP ANALYSIS ==============
+        proc.stdout.close()
+        proc.wait()
+    
+    # A transcript of partially extracted audio must not be used (or cached)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Audio extraction failed: ffmpeg exited with code {proc.returncode}")
+    return result
 
-def parse_json_safely(content: str) -> dict:
-    """Safely parse JSON from LLM response."""
-    if "```json" in content:
-        content = content.split("```json")[1].split("```")[0]
-    elif "```" in content:
-        content = content.split("```")[1].split("```")[0]
+def transcribe_video(video_path: str, source: RangedDownload = None, etag: str = None) -> dict:
+    """
+    Transcribe video using Deepgram with speaker diarization. Raises if Deepgram keeps failing.
+    If the source S3 ETag is given, identical uploads reuse the cached transcript.
+    """
+    cache_key = f"transcript:{etag}:{DEEPGRAM_PARAMS_DIGEST}" if etag else None
+    if cache_key:
+        cached = redis_client.get(cache_key)
+        if cached:
+            print(f"[Transcription] Cache hit for ETag {etag}")
+            return json.loads(cached)
     
-    content = content.strip()
+    result = _transcribe_once(video_path, source)
     
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        pass
+    if "error" in result:
+        print(f"[Transcription] Deepgram error: {result}")
+        raise RuntimeError(f"Deepgram error: {result['error']}")
     
-    match = re.search(r'\{[\s\S]*\}', content)
-    if match:
-        json_str = match.group()
-        try:
-            return json.loads(json_str)
-        except json.JSONDecodeError:
-            pass
-        
-        fixed_json = re.sub(r',(\s*[}\]])', r'\1', json_str)
-        try:
-            return json.loads(fixed_json)
-        except json.JSONDecodeError as e:
-            print(f"[JSON Parse] Still failing: {e}")
+    segments = []
+    utterances = result.get("results", {}).get("utterances", [])
+    print(f"[Transcription] Got {len(utterances)} utterances")
     
-    raise json.JSONDecodeError(f"Could not parse JSON", content, 0)
+    for utt in utterances:
+        segments.append({
+            "start": utt["start"],
+            "end": utt["end"],
+            "text": utt["transcript"],
+            "speaker": utt.get("speaker", 0)
+        })
+    
+    transcript = {"segments": segments}
+    if cache_key:
+        # A failed range GET only truncates ffmpeg's input, so make sure the whole source arrived first
+        if source is not None:
+            source.wait()
+        redis_client.setex(cache_key, RESULT_CACHE_TTL, json.dumps(transcript))
+    return transcript
 
+# ============== CLIP ANALYSIS ==============
 
-def analyze_transcript(transcript: dict) -> dict:
-    """Send transcript to Claude for clip selection."""
-    segments_text = ""
-    for seg in transcript["segments"]:
-        start = seg["start"]
-        end = seg["end"]
-        text = seg["text"].strip()
-        segments_text += f"[{start:.1f}s - {end:.1f}s]: {text}\n"
-    
-    prompt = f"""You are analyzing a podcast transcript to find the top 3 clips that would go viral on TikTok/YouTube Shorts.
+# Long transcripts are shortlisted by TRIAGE_MODEL before the stronger RANKING_MODEL ranks the picks
+TRIAGE_MIN_CHARS = 20000  # Below this the full transcript goes straight to ranking
+CANDIDATE_PADDING = 5.0  # Seconds of context around each shortlisted range
 
-TRANSCRIPT:
-{segments_text}
+# Static criteria, sent as a cached system block ahead of the stage-specific instructions
+CLIP_SELECTION_RUBRIC = """You are analyzing a podcast transcript to find clips that would go viral on TikTok/YouTube Shorts.
 
 For each clip, evaluate based on:
 1. Hook strength - Does it grab attention in the first 3 seconds?
@@ -197,133 +451,369 @@ For each clip, evaluate based on:
 3. Emotional resonance - Is it surprising, funny, controversial, or inspiring?
 4. Quotability - Does it have memorable phrasing?
 
+Each clip should be 30-60 seconds long. Pick moments that would make someone stop scrolling."""
+
+TRIAGE_INSTRUCTIONS = """Shortlist the 5-8 strongest candidate moments. Do not rank them.
+
 IMPORTANT: Return ONLY valid JSON with NO additional text. Use double quotes for all strings.
 
 Return this exact structure:
-{{"clips": [{{"rank": 1, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}}, {{"rank": 2, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}}, {{"rank": 3, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}}]}}
+{"candidates": [{"start_time": 0.0, "end_time": 60.0, "quote": "opening line"}]}"""
+
+RANKING_INSTRUCTIONS = """Pick the top 3 clips.
+
+IMPORTANT: Return ONLY valid JSON with NO additional text. Use double quotes for all strings.
+
+Return this exact structure:
+{"clips": [{"rank": 1, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}, {"rank": 2, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}, {"rank": 3, "start_time": 0.0, "end_time": 60.0, "transcript_excerpt": "quote here", "explanation": "why selected"}]}"""
 
-Each clip should be 30-60 seconds long. Pick moments that would make someone stop scrolling."""
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
+def format_segments(segments: list) -> str:
+    """Format transcript segments as timestamped lines for the LLM."""
+    segments_text = ""
+    for seg in segments:
+        start = seg["start"]
+        end = seg["end"]
+        text = seg["text"].strip()
+        segments_text += f"[{start:.1f}s - {end:.1f}s]: {text}\n"
+    return segments_text
+
+def complete_clip_selection(model: str, instructions: str, user_content: str) -> str:
+    """Run one clip-selection completion with the cached rubric prefix. Returns the response text."""
+    response = openrouter_post(
+        model,
         headers={
             "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
             "Content-Type": "application/json"
         },
         json={
-            "model": "anthropic/claude-3.7-sonnet",
-            "messages": [{"role": "user", "content": prompt}],
+            "model": model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": CLIP_SELECTION_RUBRIC,
+                            "cache_control": {"type": "ephemeral", "ttl": "1h"}
+                        },
+                        {"type": "text", "text": instructions}
+                    ]
+                },
+                {"role": "user", "content": user_content}
+            ],
             "temperature": 0.2
         }
     )
     
     result = response.json()
     content = result["choices"][0]["message"]["content"]
-    print(f"[Analyze] Raw LLM response length: {len(content)} chars")
+    print(f"[Analyze] {model} response length: {len(content)} chars")
+    return content
+
+def triage_transcript(transcript: dict) -> str:
+    """
+    Shortlist candidate moments with the fast model.
+    Returns the transcript lines around each candidate, or "" if triage produced nothing usable.
+    """
+    # Triage is only an optimization: on any failure, rank the full transcript instead
+    try:
+        content = complete_clip_selection(
+            TRIAGE_MODEL, TRIAGE_INSTRUCTIONS, f"TRANSCRIPT:\n{format_segments(transcript['segments'])}"
+        )
+        candidates = parse_json_safely(content, "candidates").get("candidates", [])
+    except Exception as e:
+        print(f"[Analyze] Triage failed, using full transcript: {e}")
+        return ""
+    if not isinstance(candidates, list):
+        return ""
+    
+    sections = []
+    for i, cand in enumerate(candidates, 1):
+        try:
+            start = float(cand["start_time"]) - CANDIDATE_PADDING
+            end = float(cand["end_time"]) + CANDIDATE_PADDING
+        except (KeyError, TypeError, ValueError):
+            continue
+        segments = [seg for seg in transcript["segments"] if seg["end"] > start and seg["start"] < end]
+        if segments:
+            sections.append(f"CANDIDATE {i}:\n{format_segments(segments)}")
     
-    return parse_json_safely(content)
+    print(f"[Analyze] Triage shortlisted {len(sections)} candidates")
+    return "\n".join(sections)
+
+def analyze_transcript(transcript: dict) -> dict:
+    """Send transcript to Claude for clip selection."""
+    segments_text = format_segments(transcript["segments"])
+    
+    # Keyed on everything that shapes the picks, so prompt or model edits invalidate old results
+    digest = hashlib.sha256("|".join([
+        TRIAGE_MODEL, RANKING_MODEL, str(TRIAGE_MIN_CHARS), str(CANDIDATE_PADDING),
+        CLIP_SELECTION_RUBRIC, TRIAGE_INSTRUCTIONS, RANKING_INSTRUCTIONS, segments_text
+    ]).encode()).hexdigest()
+    cache_key = f"clips:{digest}"
+    cached = redis_client.get(cache_key)
+    if cached:
+        print(f"[Analyze] Cache hit for transcript {digest[:12]}")
+        return json.loads(cached)
+    
+    user_content = f"TRANSCRIPT:\n{segments_text}"
+    
+    if len(segments_text) >= TRIAGE_MIN_CHARS:
+        candidates_text = triage_transcript(transcript)
+        if candidates_text:
+            user_content = f"CANDIDATE MOMENTS (transcript excerpts):\n{candidates_text}"
+    
+    content = complete_clip_selection(RANKING_MODEL, RANKING_INSTRUCTIONS, user_content)
+    clips = parse_json_safely(content, "clips")
+    if not isinstance(clips.get("clips"), list) or not clips["clips"]:
+        raise ValueError("Clip selection returned no clips")
+    redis_client.setex(cache_key, RESULT_CACHE_TTL, json.dumps(clips))
+    return clips
 
 # ============== CLIP EXTRACTION ==============
 
+# Hardware H.264 encoders in order of preference: (decode input args, encode output args)
+HW_H264_ENCODERS = {
+    "h264_nvenc": (["-hwaccel", "cuda"], ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "hq", "-b:v", "4M"]),
+    "h264_videotoolbox": (["-hwaccel", "videotoolbox"], ["-c:v", "h264_videotoolbox", "-b:v", "4M"]),
+    "h264_qsv": ([], ["-c:v", "h264_qsv", "-preset", "fast", "-b:v", "4M"]),
+}
+SOFTWARE_H264_ENCODER = ([], ["-c:v", "libx264", "-preset", "fast"])
+# When one ffmpeg encodes several clips at once, cap each x264 encoder's threads so they don't oversubscribe the CPU
+PARALLEL_X264_THREADS = 2
+
+@lru_cache(maxsize=1)
+def video_encoder() -> tuple:
+    """
+    Pick the H.264 encoder once per process: the first hardware encoder that works, else libx264.
+    Returns (input_args, output_args) for ffmpeg.
+    """
+    listed = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    ).stdout
+    for name, (input_args, output_args) in HW_H264_ENCODERS.items():
+        if name not in listed:
+            continue
+        # An encoder can be compiled in without a usable device, so try a tiny encode
+        test = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-f", "lavfi", "-i", "color=size=256x256:duration=0.1",
+             *output_args, "-f", "null", "-"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        if test.returncode == 0:
+            print(f"[Encoder] Using hardware encoder {name}")
+            return input_args, output_args
+    print("[Encoder] Using libx264")
+    return SOFTWARE_H264_ENCODER
+
 import cv2
-from video_analyzer import analyze_clip_keyframes
+import numpy as np
+from video_analyzer import analyze_clips_keyframes_batch
 
-def extract_clips(video_path: str, clips_data: dict, job_id: str) -> list:
-    """Extract video clips and upload to S3."""
-    temp_dir = tempfile.mkdtemp()
-    
+def get_video_size(video_path: str) -> tuple:
+    """Return (width, height) of a video."""
     cap = cv2.VideoCapture(video_path)
-    orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     cap.release()
+    return width, height
+
+def cropx_to_pixels_arr(cropx: np.ndarray, orig_width: int, target_width: int) -> np.ndarray:
+    """Map normalized speaker centers (0.0-1.0) to left-edge crop offsets, clamped to the frame."""
+    return np.clip((cropx * orig_width).astype(int) - target_width // 2, 0, orig_width - target_width)
+
+def build_crop_filter(keyframes: list, orig_width: int, orig_height: int, name: str) -> str:
+    """
+    Build a 9:16 crop filter that holds each keyframe's position until the next one.
+    Position changes are sent to the named crop instance with sendcmd at each keyframe
+    time, rather than evaluated per frame through a nested if() expression.
+    """
+    target_width = int(orig_height * 9 / 16)
     
-    print(f"[ClipExtract] Video: {orig_width}x{orig_height}")
+    sorted_kf = sorted(keyframes, key=lambda k: k.get("time", 0))
+    times = [kf.get("time", 0) for kf in sorted_kf]
+    positions = cropx_to_pixels_arr(
+        np.array([kf.get("cropX", 0.5) for kf in sorted_kf], dtype=float), orig_width, target_width
+    ).tolist()
     
-    target_width = int(orig_height * 9 / 16)
-    max_x = orig_width - target_width
+    crop = f"crop@{name}={target_width}:{orig_height}:{positions[0]}:0"
     
-    extracted = []
-    for clip in clips_data["clips"]:
-        start = clip["start_time"]
-        end = clip["end_time"]
-        duration = end - start
-        rank = clip["rank"]
-        
-        output_file = f"{temp_dir}/clip_{rank}.mp4"
-        
-        print(f"[ClipExtract] Clip {rank}: Analyzing keyframes...")
-        keyframes = analyze_clip_keyframes(video_path, start, duration, num_keyframes=4)
-        clip["keyframes"] = keyframes
-        
-        def cropx_to_pixels(cropx):
-            crop_center = int(cropx * orig_width)
-            return max(0, min(crop_center - target_width // 2, max_x))
-        
-        sorted_kf = sorted(keyframes, key=lambda k: k.get("time", 0))
-        print(f"[ClipExtract] Clip {rank} keyframes: {sorted_kf}")
-        
-        if len(sorted_kf) == 1:
-            crop_expr = str(cropx_to_pixels(sorted_kf[0].get("cropX", 0.5)))
-        else:
-            last_pos = cropx_to_pixels(sorted_kf[-1].get("cropX", 0.5))
-            crop_expr = str(last_pos)
-            
-            for i in range(len(sorted_kf) - 2, -1, -1):
-                t_next = sorted_kf[i + 1].get("time", 0)
-                pos_curr = cropx_to_pixels(sorted_kf[i].get("cropX", 0.5))
-                crop_expr = f"if(lt(t,{t_next}),{pos_curr},{crop_expr})"
-        
-        video_filter = f"crop={target_width}:{orig_height}:'{crop_expr}':0,scale=1080:1920"
-        
-        cmd = [
-            "ffmpeg", "-y",
-            "-ss", str(start),
-            "-i", video_path,
-            "-t", str(duration),
-            "-vf", video_filter,
-            "-c:v", "libx264", "-c:a", "aac", "-preset", "fast",
-            output_file
-        ]
-        print(f"[ClipExtract] Running ffmpeg for clip {rank}")
-        subprocess.run(cmd, capture_output=True)
+    if len(sorted_kf) == 1:
+        return crop
+    
+    commands = ";".join(f"{t} crop@{name} x {x}" for t, x in zip(times[1:], positions[1:]))
+    return f"sendcmd=c='{commands}',{crop}"
+
+def _build_render_cmd(video_path: str, renders: list, outputs: list, output_args: list = ()) -> list:
+    """
+    Build one ffmpeg command encoding 9:16 clips from a source video.
+    Every clip gets its own input seek (so only the clip windows are decoded)
+    and its own crop/scale/encode chain, written to the matching entry of `outputs`.
+    """
+    orig_width, orig_height = get_video_size(video_path)
+    input_args, encoder_args = video_encoder()
+    
+    print(f"[Render] Video: {orig_width}x{orig_height}, {len(renders)} clip(s)")
+    
+    cmd = ["ffmpeg", "-y", "-loglevel", "error"]
+    for render in renders:
+        cmd += [*input_args, "-ss", str(render["start"]), "-t", str(render["duration"]), "-i", video_path]
+    
+    filters = []
+    for i, render in enumerate(renders):
+        crop_filter = build_crop_filter(render["keyframes"], orig_width, orig_height, f"clip{i}")
+        filters.append(f"[{i}:v]{crop_filter},scale=1080:1920[v{i}]")
+    cmd += ["-filter_complex", ";".join(filters)]
+    
+    if len(renders) > 1 and encoder_args == SOFTWARE_H264_ENCODER[1]:
+        encoder_args = [*encoder_args, "-threads", str(PARALLEL_X264_THREADS)]
+    
+    for i, output in enumerate(outputs):
+        cmd += ["-map", f"[v{i}]", "-map", f"{i}:a?", *encoder_args, "-c:a", "aac", *output_args, output]
+    return cmd
+
+def _ffmpeg_error(stderr_file) -> RuntimeError:
+    """Build an error from the tail of an ffmpeg log written to a temp file."""
+    stderr_file.seek(0)
+    return RuntimeError(f"ffmpeg failed: {stderr_file.read().decode(errors='ignore')[-2000:]}")
+
+def render_clips(video_path: str, renders: list):
+    """
+    Encode clips to local files in a single ffmpeg process. Raises RuntimeError if ffmpeg fails.
+    Each render is {"start", "duration", "keyframes", "output"}.
+    """
+    cmd = _build_render_cmd(video_path, renders, [render["output"] for render in renders])
+    
+    # Log to a file rather than a pipe so a long encode can never block on a full pipe buffer
+    with tempfile.TemporaryFile() as stderr_file:
+        returncode = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=stderr_file).returncode
+        if returncode != 0:
+            raise _ffmpeg_error(stderr_file)
+
+def render_clips_to_s3(video_path: str, renders: list) -> list:
+    """
+    Encode clips in a single ffmpeg process and stream each one straight into an S3 upload.
+    Each render is {"start", "duration", "keyframes", "s3_key"}. Returns presigned URLs in order.
+    Clips are fragmented mp4 because the output pipes are not seekable.
+    """
+    if not renders:
+        return []
+    
+    pipes = [os.pipe() for _ in renders]
+    cmd = _build_render_cmd(
+        video_path, renders,
+        [f"pipe:{write_fd}" for _, write_fd in pipes],
+        ["-movflags", "+frag_keyframe+empty_moov", "-f", "mp4"]
+    )
+    
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr_file,
+            pass_fds=[write_fd for _, write_fd in pipes]
+        )
+        for _, write_fd in pipes:
+            os.close(write_fd)
+        readers = [os.fdopen(read_fd, "rb") for read_fd, _ in pipes]
         
-        # Upload to S3
-        s3_key = f"clips/{job_id}/clip_{rank}.mp4"
-        clip_url = upload_to_s3(output_file, s3_key)
+        def _upload_pipe(reader, s3_key):
+            # Close as soon as this upload ends, so a failed upload makes ffmpeg exit instead of blocking
+            with reader:
+                return upload_stream_to_s3(reader, s3_key)
         
-        # Clean up local file
-        os.remove(output_file)
+        urls = None
+        try:
+            # Every pipe must be drained concurrently or ffmpeg stalls on the slowest one
+            with ThreadPoolExecutor(max_workers=len(renders)) as executor:
+                urls = list(executor.map(_upload_pipe, readers, [render["s3_key"] for render in renders]))
+        finally:
+            for reader in readers:
+                reader.close()
+            if urls is None and proc.poll() is None:
+                proc.kill()
+            proc.wait()
+            if urls is None or proc.returncode != 0:
+                # Uploads that finished on a closed pipe left empty or truncated clips behind
+                for render in renders:
+                    try:
+                        s3_client.delete_object(Bucket=S3_BUCKET, Key=render["s3_key"])
+                    except Exception as e:
+                        print(f"[Render] Failed to delete partial clip {render['s3_key']}: {e}")
         
-        extracted.append({
-            "rank": rank,
-            "s3_key": s3_key,
-            "video_url": clip_url,
-            "keyframes": keyframes
-        })
+        if proc.returncode != 0:
+            raise _ffmpeg_error(stderr_file)
+    
+    return urls
+
+def extract_clips(video_path: str, clips_data: dict, job_id: str, source_etag: str = None) -> list:
+    """Extract video clips and stream them to S3. The source ETag keys the keyframe cache."""
+    clips = clips_data["clips"]
+    if not clips:
+        return []
+    
+    # One vision request covers every clip's frames
+    print(f"[ClipExtract] Analyzing keyframes for {len(clips)} clips...")
+    keyframes_by_rank = analyze_clips_keyframes_batch(video_path, clips, num_keyframes=4, source_id=source_etag)
+    for clip in clips:
+        clip["keyframes"] = keyframes_by_rank[clip["rank"]]
+        print(f"[ClipExtract] Clip {clip['rank']} keyframes: {clip['keyframes']}")
+    
+    renders = [{
+        "start": clip["start_time"],
+        "duration": clip["end_time"] - clip["start_time"],
+        "keyframes": clip["keyframes"],
+        "s3_key": f"clips/{job_id}/clip_{clip['rank']}.mp4"
+    } for clip in clips]
     
-    return extracted
+    print(f"[ClipExtract] Running ffmpeg for {len(clips)} clips")
+    urls = render_clips_to_s3(video_path, renders)
+    
+    return [{
+        "rank": clip["rank"],
+        "s3_key": render["s3_key"],
+        "video_url": url,
+        "keyframes": clip["keyframes"]
+    } for clip, render, url in zip(clips, renders, urls)]
 
 # ============== JOB PROCESSING ==============
 
 def process_video(job_id: str, s3_key: str):
     """Background job to process video from S3."""
     temp_video = None
+    download = None
     try:
         # Download video from S3
-        jobs[job_id]["status"] = "downloading"
-        jobs[job_id]["progress"] = "Downloading video from S3..."
+        _set_job(
+            job_id,
+            status="downloading",
+            progress="Downloading video from S3..."
+        )
         
         temp_video = tempfile.mktemp(suffix=".mp4")
-        download_from_s3(s3_key, temp_video)
+        download = RangedDownload(s3_key, temp_video)
+        
+        # Faststart mp4s can be transcribed while the rest is still downloading
+        stream_source = download if download.moov_at_front() else None
+        if stream_source is None:
+            download.wait()
         
         # Transcribe
-        jobs[job_id]["status"] = "transcribing"
-        jobs[job_id]["progress"] = "Transcribing with speaker diarization..."
+        _set_job(
+            job_id,
+            status="transcribing",
+            progress="Transcribing with speaker diarization..."
+        )
         
-        transcript = transcribe_video(temp_video)
+        transcript = transcribe_video(temp_video, stream_source, etag=download.etag)
         
-        jobs[job_id]["status"] = "analyzing"
-        jobs[job_id]["progress"] = "Analyzing transcript for viral clips..."
+        _set_job(
+            job_id,
+            status="analyzing",
+            progress="Analyzing transcript for viral clips..."
+        )
         
         clips = analyze_transcript(transcript)
         
@@ -335,10 +825,15 @@ def process_video(job_id: str, s3_key: str):
                 "text": seg["text"].strip()
             })
         
-        jobs[job_id]["status"] = "extracting"
-        jobs[job_id]["progress"] = "Extracting and uploading clips..."
+        download.wait()
+        
+        _set_job(
+            job_id,
+            status="extracting",
+            progress="Extracting and uploading clips..."
+        )
         
-        extracted_clips = extract_clips(temp_video, clips, job_id)
+        extracted_clips = extract_clips(temp_video, clips, job_id, source_etag=download.etag)
         
         # Update clip URLs
         for clip in clips["clips"]:
@@ -347,19 +842,27 @@ def process_video(job_id: str, s3_key: str):
                     clip["video_url"] = ext["video_url"]
                     clip["s3_key"] = ext["s3_key"]
         
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["progress"] = "Done!"
-        jobs[job_id]["result"] = clips
-        jobs[job_id]["transcript"] = full_transcript
-        jobs[job_id]["source_s3_key"] = s3_key
+        _set_job(
+            job_id,
+            status="completed",
+            progress="Done!",
+            result=clips,
+            transcript=full_transcript,
+            source_s3_key=s3_key
+        )
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["progress"] = f"Error: {str(e)}"
-        jobs[job_id]["error"] = str(e)
+        _set_job(
+            job_id,
+            status="failed",
+            progress=f"Error: {str(e)}",
+            error=str(e)
+        )
     finally:
+        if download:
+            download.close()
         if temp_video and os.path.exists(temp_video):
             os.remove(temp_video)
 
@@ -380,6 +883,64 @@ def get_upload_url_route():
     result = get_upload_url(filename, content_type)
     return jsonify(result)
 
+@app.route("/get-upload-urls", methods=["POST"])
+def get_upload_urls_route():
+    """Start a multipart S3 upload; part URLs are then fetched in batches from /get-part-urls."""
+    data = request.json
+    filename = data.get("filename", "video.mp4")
+    content_type = data.get("content_type", "video/mp4")
+    file_size = data.get("file_size")
+    
+    if not file_size:
+        return jsonify({"error": "No file_size provided"}), 400
+    
+    result = start_multipart_upload(filename, int(file_size), content_type)
+    return jsonify(result)
+
+@app.route("/get-part-urls", methods=["POST"])
+def get_part_urls_route():
+    """Get presigned URLs for a range of parts of a multipart S3 upload."""
+    data = request.json
+    s3_key = data.get("s3_key")
+    upload_id = data.get("upload_id")
+    first_part = int(data.get("first_part", 1))
+    count = int(data.get("count", 1))
+    
+    if not s3_key or not upload_id:
+        return jsonify({"error": "s3_key and upload_id are required"}), 400
+    if first_part < 1 or count < 1 or count > MAX_PART_URLS_PER_REQUEST or first_part + count - 1 > MAX_UPLOAD_PARTS:
+        return jsonify({"error": "Invalid part range"}), 400
+    
+    part_urls = get_part_upload_urls(s3_key, upload_id, first_part, count)
+    return jsonify({"part_urls": part_urls})
+
+@app.route("/complete-upload", methods=["POST"])
+def complete_upload_route():
+    """Complete a multipart S3 upload once the client has uploaded every part."""
+    data = request.json
+    s3_key = data.get("s3_key")
+    upload_id = data.get("upload_id")
+    parts = data.get("parts")
+    
+    if not s3_key or not upload_id or not parts:
+        return jsonify({"error": "s3_key, upload_id and parts are required"}), 400
+    
+    complete_multipart_upload(s3_key, upload_id, parts)
+    return jsonify({"s3_key": s3_key})
+
+@app.route("/abort-upload", methods=["POST"])
+def abort_upload_route():
+    """Abort a failed multipart S3 upload so its parts don't linger in the bucket."""
+    data = request.json
+    s3_key = data.get("s3_key")
+    upload_id = data.get("upload_id")
+    
+    if not s3_key or not upload_id:
+        return jsonify({"error": "s3_key and upload_id are required"}), 400
+    
+    abort_multipart_upload(s3_key, upload_id)
+    return jsonify({"aborted": True})
+
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """Start video analysis job from S3 key."""
@@ -391,34 +952,36 @@ def analyze():
     
     # Create job
     job_id = str(uuid.uuid4())[:8]
-    jobs[job_id] = {
-        "status": "queued",
-        "progress": "Queued for processing...",
-        "result": None,
-        "error": None,
-        "s3_key": s3_key
-    }
-    
-    # Start background processing
-    thread = threading.Thread(target=process_video, args=(job_id, s3_key))
-    thread.start()
+    _set_job(
+        job_id,
+        status="queued",
+        progress="Queued for processing...",
+        result=None,
+        error=None,
+        s3_key=s3_key
+    )
+    
+    # Hand off to an RQ worker process (referenced by path so it resolves under `python app.py` too)
+    job_queue.enqueue("app.process_video", job_id, s3_key, job_timeout=3600)
     
     return jsonify({"job_id": job_id})
 
 @app.route("/status/<job_id>")
 def status(job_id):
     """Get job status."""
-    if job_id not in jobs:
+    job = _get_job(job_id)
+    if not job:
         return jsonify({"error": "Job not found"}), 404
-    return jsonify(jobs[job_id])
+    return jsonify(job)
 
 @app.route("/source-url/<job_id>")
 def get_source_url(job_id):
     """Get presigned URL for source video (for crop editor)."""
-    if job_id not in jobs:
+    job = _get_job(job_id)
+    if not job:
         return jsonify({"error": "Job not found"}), 404
     
-    s3_key = jobs[job_id].get("source_s3_key")
+    s3_key = job.get("source_s3_key")
     if not s3_key:
         return jsonify({"error": "Source not found"}), 404
     
@@ -437,10 +1000,10 @@ def reexport_clip():
     clip_rank = data.get("clip_rank")
     keyframes = data.get("keyframes", [{"time": 0, "cropX": 0.5}])
     
-    if job_id not in jobs:
+    job = _get_job(job_id)
+    if not job:
         return jsonify({"error": "Job not found"}), 404
     
-    job = jobs[job_id]
     s3_key = job.get("source_s3_key")
     result = job.get("result")
     
@@ -461,55 +1024,24 @@ def reexport_clip():
     download_from_s3(s3_key, temp_video)
     
     try:
-        cap = cv2.VideoCapture(temp_video)
-        orig_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        orig_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        cap.release()
-        
-        target_width = int(orig_height * 9 / 16)
-        max_x = orig_width - target_width
-        
         temp_output = tempfile.mktemp(suffix=".mp4")
         
         start = clip["start_time"]
         duration = clip["end_time"] - start
         
-        sorted_kf = sorted(keyframes, key=lambda k: k.get("time", 0))
-        
-        def cropx_to_pixels(cropx):
-            crop_center = int(cropx * orig_width)
-            return max(0, min(crop_center - target_width // 2, max_x))
-        
-        if len(sorted_kf) == 1:
-            crop_expr = str(cropx_to_pixels(sorted_kf[0].get("cropX", 0.5)))
-        else:
-            last_pos = cropx_to_pixels(sorted_kf[-1].get("cropX", 0.5))
-            crop_expr = str(last_pos)
-            
-            for i in range(len(sorted_kf) - 2, -1, -1):
-                t_next = sorted_kf[i + 1].get("time", 0)
-                pos_curr = cropx_to_pixels(sorted_kf[i].get("cropX", 0.5))
-                crop_expr = f"if(lt(t,{t_next}),{pos_curr},{crop_expr})"
+        print(f"[ReExport] Keyframes: {sorted(keyframes, key=lambda k: k.get('time', 0))}")
         
-        print(f"[ReExport] Keyframes: {sorted_kf}")
-        print(f"[ReExport] Crop expression: {crop_expr}")
-        
-        video_filter = f"crop={target_width}:{orig_height}:'{crop_expr}':0,scale=1080:1920"
-        
-        cmd = [
-            "ffmpeg", "-y",
-            "-ss", str(start),
-            "-i", temp_video,
-            "-t", str(duration),
-            "-vf", video_filter,
-            "-c:v", "libx264", "-c:a", "aac", "-preset", "fast",
-            temp_output
-        ]
-        
-        result_proc = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result_proc.returncode != 0:
-            print(f"[ReExport] ffmpeg error: {result_proc.stderr}")
+        try:
+            render_clips(temp_video, [{
+                "start": start,
+                "duration": duration,
+                "keyframes": keyframes,
+                "output": temp_output
+            }])
+        except RuntimeError as e:
+            print(f"[ReExport] {e}")
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
             return jsonify({"error": "Export failed"}), 500
         
         # Upload to S3
@@ -517,8 +1049,7 @@ def reexport_clip():
         clip_url = upload_to_s3(temp_output, clip_s3_key)
         
         # Update job data
-        clip["video_url"] = clip_url
-        clip["keyframes"] = keyframes
+        _update_job_clip(job_id, clip_rank, video_url=clip_url, keyframes=keyframes)
         
         os.remove(temp_output)
         
@@ -0,0 +1,90 @@
+"""
+HTTP Clients - Pooled HTTP/2 clients shared by all Deepgram and OpenRouter calls.
+Reusing connections skips a TCP+TLS handshake per request and lets concurrent calls share a socket.
+Calls are throttled with Redis-backed token buckets and retried with jittered backoff on 429/5xx.
+"""
+import os
+import threading
+import httpx
+from pyrate_limiter import BucketFullException, Duration, Limiter, LimiterDelayException, Rate, RedisBucket
+from redis import Redis
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+
+HTTP_CLIENT = httpx.Client(
+    http2=True,
+    timeout=httpx.Timeout(300.0, connect=10.0),
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
+# Separate client for Deepgram so its connection isn't evicted by LLM traffic
+DEEPGRAM_CLIENT = httpx.Client(
+    http2=True,
+    base_url="https://api.deepgram.com",
+    timeout=httpx.Timeout(300.0, connect=10.0),
+    limits=httpx.Limits(max_keepalive_connections=4)
+)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# OpenRouter models, defined here so their rate limits are keyed off the same names callers use
+TRIAGE_MODEL = "anthropic/claude-haiku-4.5"
+RANKING_MODEL = "anthropic/claude-3.7-sonnet"
+VISION_MODEL = "anthropic/claude-sonnet-4"
+
+# Request rates per endpoint; buckets live in Redis so limits hold across all worker processes
+DEEPGRAM_RATE = Rate(300, Duration.MINUTE)
+OPENROUTER_RATES = {
+    TRIAGE_MODEL: Rate(120, Duration.MINUTE),
+}
+OPENROUTER_DEFAULT_RATE = Rate(60, Duration.MINUTE)
+
+_redis = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _get_limiter(name: str, rate: Rate) -> Limiter:
+    """Return the shared limiter for an endpoint, creating its Redis bucket on first use."""
+    with _limiters_lock:
+        if name not in _limiters:
+            bucket = RedisBucket.init([rate], _redis, f"ratelimit:{name}")
+            _limiters[name] = Limiter(bucket, max_delay=Duration.MINUTE, retry_until_max_delay=True)
+        return _limiters[name]
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Retry rate limits, server errors and network failures; other 4xx errors are permanent."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, (httpx.TransportError, BucketFullException, LimiterDelayException))
+
+
+# Jittered exponential backoff shared by all API calls
+retry_api = retry(
+    wait=wait_exponential_jitter(1, 60),
+    retry=retry_if_exception(_is_retryable),
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+
+
+def deepgram_post(**kwargs) -> httpx.Response:
+    """
+    POST to Deepgram's /v1/listen within the rate limit; raises httpx.HTTPStatusError on error.
+    Not retried here: a streamed body can only be sent once, so callers retry the whole upload.
+    """
+    _get_limiter("deepgram", DEEPGRAM_RATE).try_acquire("deepgram")
+    response = DEEPGRAM_CLIENT.post("/v1/listen", **kwargs)
+    response.raise_for_status()
+    return response
+
+
+@retry_api
+def openrouter_post(model: str, **kwargs) -> httpx.Response:
+    """POST a chat completion for `model` to OpenRouter within its rate limit, retrying transient errors."""
+    name = f"openrouter:{model}"
+    _get_limiter(name, OPENROUTER_RATES.get(model, OPENROUTER_DEFAULT_RATE)).try_acquire(name)
+    response = HTTP_CLIENT.post(OPENROUTER_URL, **kwargs)
+    response.raise_for_status()
+    return response
@@ -0,0 +1,49 @@
+"""
+LLM JSON - Parses the JSON object out of a model reply.
+Shared by clip selection and keyframe analysis so both tolerate the same reply quirks.
+"""
+import json
+import orjson
+import json_repair
+
+
+def _pick_object(parsed, expected_key: str = None) -> dict:
+    """
+    Return the object from a parsed reply. A reply with several JSON-like fragments
+    (e.g. bracketed timestamps quoted in prose) parses to a list of them, so pick the
+    first dict holding `expected_key`, falling back to the first dict.
+    """
+    if isinstance(parsed, dict):
+        return parsed
+    if isinstance(parsed, list):
+        objects = [item for item in parsed if isinstance(item, dict)]
+        for obj in objects:
+            if expected_key is None or expected_key in obj:
+                return obj
+        if objects:
+            return objects[0]
+    return None
+
+
+def parse_json_safely(content: str, expected_key: str = None) -> dict:
+    """Parse the JSON object from an LLM reply. Raises json.JSONDecodeError if it has none."""
+    if "```json" in content:
+        content = content.split("```json")[1].split("```")[0]
+    elif "```" in content:
+        content = content.split("```")[1].split("```")[0]
+
+    content = content.strip()
+
+    try:
+        parsed = _pick_object(orjson.loads(content), expected_key)
+        if parsed is not None:
+            return parsed
+    except orjson.JSONDecodeError:
+        pass
+
+    # Linear-time repair: surrounding prose, trailing commas, missing quotes, etc.
+    parsed = _pick_object(json_repair.repair_json(content, return_objects=True), expected_key)
+    if parsed is not None:
+        return parsed
+
+    raise json.JSONDecodeError("Could not parse JSON", content, 0)
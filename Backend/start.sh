@@ -6,5 +6,8 @@ cd /home/ubuntu/videotto/Backend
 # Activate virtual environment
 source venv/bin/activate
 
+# Start the RQ worker that runs video processing jobs
+rq worker --url "${REDIS_URL:-redis://localhost:6379/0}" videotto &
+
 # Run with gunicorn (4 workers, bind to all interfaces)
 gunicorn -w 4 -b 0.0.0.0:5001 --timeout 300 app:app
@@ -4,38 +4,102 @@ Sends sample frames to LLM without bias to get optimal CV parameters.
 """
 import cv2
 import base64
-import requests
-import json
+from http_clients import VISION_MODEL, openrouter_post
+from llm_json import parse_json_safely
 import os
+import subprocess
+import tempfile
+import diskcache
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Keyframe responses keyed by clip window, matched on per-frame perceptual hashes
+KEYFRAME_CACHE_DIR = os.getenv("KEYFRAME_CACHE_DIR", os.path.join(tempfile.gettempdir(), "videotto-keyframes"))
+keyframe_cache = diskcache.Cache(KEYFRAME_CACHE_DIR)
+
+# Frames sent to the vision model are small; it downsamples anyway
+SAMPLE_FRAME_SIZE = (384, 216)
+
+# Max differing hash bits per frame for two frame sets to count as the same clip
+PHASH_MAX_DISTANCE = 6
+# Cached frame sets kept per clip window
+KEYFRAME_CACHE_ENTRIES = 8
 
 
 def sample_clip_frames(video_path: str, start: float, duration: float, num_frames: int = 8) -> list:
-    """Sample frames from a specific clip segment."""
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
+    """Sample evenly spaced frames from a clip segment in a single ffmpeg decode pass."""
+    width, height = SAMPLE_FRAME_SIZE
+    targets = [duration * i / (num_frames - 1) for i in range(num_frames)]
     
-    frames = []
-    for i in range(num_frames):
-        t = start + (duration * i / (num_frames - 1))
-        cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000)
-        ret, frame = cap.read()
-        if ret:
-            frame = cv2.resize(frame, (480, 270))  # Smaller for faster upload
-            frames.append(frame)
+    # Pick the first frame at or after each target timestamp
+    select = "+".join(
+        ["isnan(prev_selected_t)"] +
+        [f"lt(prev_selected_t,{t:.3f})*gte(t,{t:.3f})" for t in targets[1:]]
+    )
+    cmd = [
+        "ffmpeg",
+        "-ss", str(start),
+        "-t", str(duration + 1),  # Slack so the last target still has a frame
+        "-i", video_path,
+        "-an",
+        "-vf", f"select='{select}',scale={width}:{height}",
+        "-vsync", "0",
+        "-frames:v", str(num_frames),
+        "-f", "rawvideo", "-pix_fmt", "bgr24",
+        "pipe:1"
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
     
-    cap.release()
+    raw = bytearray(result.stdout)
+    frame_size = width * height * 3
+    frames = []
+    for offset in range(0, len(raw) - frame_size + 1, frame_size):
+        frame = np.frombuffer(raw, dtype=np.uint8, count=frame_size, offset=offset)
+        frames.append(frame.reshape(height, width, 3))
     return frames
 
 
 def frames_to_base64(frames: list) -> list:
-    """Convert frames to base64."""
+    """Convert frames to base64-encoded WebP."""
     encoded = []
     for frame in frames:
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
-        encoded.append(base64.b64encode(buffer).decode('utf-8'))
+        _, buffer = cv2.imencode('.webp', frame, [cv2.IMWRITE_WEBP_QUALITY, 40])
+        encoded.append(base64.b64encode(buffer).decode('ascii'))
     return encoded
 
 
+def frame_phash(frame) -> int:
+    """64-bit DCT perceptual hash of a frame."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype("float32")
+    low = cv2.dct(small)[:8, :8].flatten().tolist()
+    median = sorted(low)[len(low) // 2]
+    
+    bits = 0
+    for value in low:
+        bits = (bits << 1) | int(value > median)
+    return bits
+
+
+def get_cached_keyframes(cache_key: tuple, hashes: list):
+    """Return keyframes from a cached frame set that matches within PHASH_MAX_DISTANCE, or None."""
+    for entry in keyframe_cache.get(cache_key, []):
+        if len(entry["hashes"]) != len(hashes):
+            continue
+        if all(bin(a ^ b).count("1") <= PHASH_MAX_DISTANCE for a, b in zip(entry["hashes"], hashes)):
+            return entry["keyframes"]
+    return None
+
+
+def cache_keyframes(cache_key: tuple, hashes: list, keyframes: list):
+    """Store keyframes for a frame set, keeping the most recent entries per clip window."""
+    with keyframe_cache.transact():
+        entries = keyframe_cache.get(cache_key, [])
+        entries.append({"hashes": hashes, "keyframes": keyframes})
+        keyframe_cache.set(cache_key, entries[-KEYFRAME_CACHE_ENTRIES:])
+
+
 def analyze_clip_for_speaker(video_path: str, start: float, duration: float) -> float:
     """
     Analyze a specific clip segment with LLM to find the active speaker position.
@@ -47,109 +111,234 @@ def analyze_clip_for_speaker(video_path: str, start: float, duration: float) ->
     return 0.5
 
 
-def analyze_clip_keyframes(video_path: str, start: float, duration: float, num_keyframes: int = 4) -> list:
-    """
-    Analyze a clip at multiple timestamps and return keyframes with speaker positions.
-    Returns list of {"time": <seconds from clip start>, "cropX": <0.0-1.0>}
-    """
-    # Sample more frames for keyframe analysis
-    num_frames = max(num_keyframes * 2, 6)
-    frames = sample_clip_frames(video_path, start, duration, num_frames=num_frames)
-    
-    if not frames:
-        return [{"time": 0, "cropX": 0.5}]
-    
-    encoded_frames = frames_to_base64(frames)
-    
-    # Calculate timestamps for each frame
-    frame_times = [duration * i / (num_frames - 1) for i in range(num_frames)]
-    
-    prompt = f"""I'm showing you {num_frames} frames from a video clip, sampled at regular intervals.
-The clip is {duration:.1f} seconds long.
-
-Frame timestamps (seconds from start): {', '.join([f'{t:.1f}s' for t in frame_times])}
+# Static speaker-tracking instructions, sent as a cached system block ahead of the frames
+KEYFRAME_GUIDELINES = """You will be shown frames from a video clip, each labeled with its timestamp in seconds from the clip start.
 
 For each frame, identify where the ACTIVE SPEAKER is positioned horizontally.
 Look for: mouth movement, hand gestures, body language, eye gaze of listeners.
 
 Return ONLY this JSON with speaker positions at key moments:
-{{
+{
     "keyframes": [
-        {{"time": 0.0, "cropX": <0.0-1.0>, "notes": "<who is speaking>"}},
-        {{"time": <seconds>, "cropX": <0.0-1.0>, "notes": "<who is speaking>"}},
+        {"time": 0.0, "cropX": <0.0-1.0>, "notes": "<who is speaking>"},
+        {"time": <seconds>, "cropX": <0.0-1.0>, "notes": "<who is speaking>"},
         ...
     ]
-}}
+}
 
 Guidelines for cropX:
 - 0.0 = speaker at left edge
-- 0.5 = speaker at center  
+- 0.5 = speaker at center
 - 1.0 = speaker at right edge
 
 Include a keyframe whenever the active speaker CHANGES or MOVES significantly.
-Minimum 2 keyframes, maximum {num_keyframes} keyframes.
 Only add keyframes where there's a meaningful change in speaker position."""
 
-    content = [{"type": "text", "text": prompt}]
-    for i, b64 in enumerate(encoded_frames):
-        content.append({"type": "text", "text": f"Frame {i+1} ({frame_times[i]:.1f}s):"})
-        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
+
+# Appended after the guidelines when several clips are analyzed in one request
+BATCH_KEYFRAME_INSTRUCTIONS = """Frames from several clips are shown, grouped under "CLIP <rank>" labels.
+Analyze each clip independently; keyframe times are seconds from that clip's own start.
+
+Instead of a single "keyframes" object, return ONLY this JSON with one entry per clip:
+{
+    "clips": [
+        {"rank": <rank>, "keyframes": [{"time": 0.0, "cropX": <0.0-1.0>, "notes": "<who is speaking>"}, ...]},
+        ...
+    ]
+}"""
+
+
+def request_keyframes(content: list, instructions: str = None, timeout: float = 60, expected_key: str = "keyframes") -> dict:
+    """
+    Send frames to the vision model with the cached keyframe guidelines.
+    Returns the parsed JSON response (the object holding `expected_key`), or None if the request or parsing fails.
+    """
+    system = [{
+        "type": "text",
+        "text": KEYFRAME_GUIDELINES,
+        "cache_control": {"type": "ephemeral"}
+    }]
+    if instructions:
+        system.append({"type": "text", "text": instructions})
     
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
+        response = openrouter_post(
+            VISION_MODEL,
             headers={
                 "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
                 "Content-Type": "application/json"
             },
             json={
-                "model": "anthropic/claude-sonnet-4",
-                "messages": [{"role": "user", "content": content}],
+                "model": VISION_MODEL,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": content}
+                ],
                 "temperature": 0.2
             },
-            timeout=60
+            timeout=timeout
         )
         
         result = response.json()
         response_text = result["choices"][0]["message"]["content"]
         
-        # Parse JSON
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
-        
-        import re
-        match = re.search(r'\{[\s\S]*\}', response_text)
-        if match:
-            data = json.loads(match.group())
-            keyframes = data.get("keyframes", [])
-            
-            # Validate and clean keyframes
-            valid_keyframes = []
-            for kf in keyframes:
-                time = float(kf.get("time", 0))
-                cropX = float(kf.get("cropX", 0.5))
-                # Clamp values
-                time = max(0, min(duration, time))
-                cropX = max(0.1, min(0.9, cropX))
-                valid_keyframes.append({"time": time, "cropX": cropX})
-            
-            if valid_keyframes:
-                # Sort by time
-                valid_keyframes.sort(key=lambda k: k["time"])
-                print(f"[VideoAnalyzer] LLM detected {len(valid_keyframes)} keyframes")
-                for kf in valid_keyframes:
-                    print(f"  - {kf['time']:.1f}s: cropX={kf['cropX']:.2f}")
-                return valid_keyframes
-            
+        return parse_json_safely(response_text, expected_key)
     except Exception as e:
         print(f"[VideoAnalyzer] LLM keyframe analysis failed: {e}")
     
+    return None
+
+
+def clean_keyframes(keyframes: list, duration: float) -> list:
+    """Validate, clamp and sort keyframes returned by the LLM."""
+    valid_keyframes = []
+    for kf in keyframes:
+        try:
+            time = float(kf.get("time", 0))
+            cropX = float(kf.get("cropX", 0.5))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        # Clamp values
+        time = max(0, min(duration, time))
+        cropX = max(0.1, min(0.9, cropX))
+        valid_keyframes.append({"time": time, "cropX": cropX})
+    
+    # Sort by time
+    valid_keyframes.sort(key=lambda k: k["time"])
+    if valid_keyframes:
+        print(f"[VideoAnalyzer] LLM detected {len(valid_keyframes)} keyframes")
+        for kf in valid_keyframes:
+            print(f"  - {kf['time']:.1f}s: cropX={kf['cropX']:.2f}")
+    return valid_keyframes
+
+
+def analyze_clip_keyframes(video_path: str, start: float, duration: float, num_keyframes: int = 4,
+                           source_id: str = None) -> list:
+    """
+    Analyze a clip at multiple timestamps and return keyframes with speaker positions.
+    `source_id` (e.g. the source's S3 ETag) enables the keyframe cache; without it every call hits the LLM.
+    Returns list of {"time": <seconds from clip start>, "cropX": <0.0-1.0>}
+    """
+    # Sample more frames for keyframe analysis
+    num_frames = max(num_keyframes * 2, 6)
+    frames = sample_clip_frames(video_path, start, duration, num_frames=num_frames)
+    
+    if not frames:
+        return [{"time": 0, "cropX": 0.5}]
+    
+    # Re-exports and re-runs of the same clip reuse the previous response. The pHash only
+    # describes the scene layout, so the key must also pin the source video.
+    cache_key = (source_id, round(start, 2), round(duration, 2), num_keyframes) if source_id else None
+    hashes = [frame_phash(frame) for frame in frames]
+    cached = get_cached_keyframes(cache_key, hashes) if cache_key else None
+    if cached:
+        print(f"[VideoAnalyzer] Keyframe cache hit for clip at {start:.1f}s")
+        return cached
+    
+    encoded_frames = frames_to_base64(frames)
+    
+    # Calculate timestamps for each frame
+    frame_times = [duration * i / (num_frames - 1) for i in range(num_frames)]
+    
+    prompt = f"""I'm showing you {num_frames} frames from a video clip, sampled at regular intervals.
+The clip is {duration:.1f} seconds long.
+
+Frame timestamps (seconds from start): {', '.join([f'{t:.1f}s' for t in frame_times])}
+
+Minimum 2 keyframes, maximum {num_keyframes} keyframes."""
+
+    content = [{"type": "text", "text": prompt}]
+    for i, b64 in enumerate(encoded_frames):
+        content.append({"type": "text", "text": f"Frame {i+1} ({frame_times[i]:.1f}s):"})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/webp;base64,{b64}"}})
+    
+    data = request_keyframes(content)
+    if data:
+        valid_keyframes = clean_keyframes(data.get("keyframes", []), duration)
+        if valid_keyframes:
+            if cache_key:
+                cache_keyframes(cache_key, hashes, valid_keyframes)
+            return valid_keyframes
+    
     # Default: single keyframe at center
     return [{"time": 0, "cropX": 0.5}]
 
 
+def analyze_clips_keyframes_batch(video_path: str, clips: list, num_keyframes: int = 4, source_id: str = None) -> dict:
+    """
+    Analyze keyframes for several clips ({"rank", "start_time", "end_time"}) in one vision request.
+    If `source_id` is given, clips already in the keyframe cache are answered from it and left out of the request.
+    Returns {rank: keyframes}.
+    """
+    num_frames = max(num_keyframes * 2, 6)
+    
+    def _sample(clip):
+        duration = clip["end_time"] - clip["start_time"]
+        return sample_clip_frames(video_path, clip["start_time"], duration, num_frames=num_frames)
+    
+    with ThreadPoolExecutor(max_workers=max(len(clips), 1)) as executor:
+        sampled = list(executor.map(_sample, clips))
+    
+    results = {}
+    pending = []
+    for clip, frames in zip(clips, sampled):
+        rank = clip["rank"]
+        start = clip["start_time"]
+        duration = clip["end_time"] - start
+        
+        if not frames:
+            results[rank] = [{"time": 0, "cropX": 0.5}]
+            continue
+        
+        cache_key = (source_id, round(start, 2), round(duration, 2), num_keyframes) if source_id else None
+        hashes = [frame_phash(frame) for frame in frames]
+        cached = get_cached_keyframes(cache_key, hashes) if cache_key else None
+        if cached:
+            print(f"[VideoAnalyzer] Keyframe cache hit for clip {rank}")
+            results[rank] = cached
+            continue
+        
+        pending.append({"rank": rank, "duration": duration, "frames": frames, "cache_key": cache_key, "hashes": hashes})
+    
+    if not pending:
+        return results
+    
+    content = [{"type": "text", "text": f"""I'm showing you frames from {len(pending)} video clips, sampled at regular intervals.
+
+Minimum 2 keyframes, maximum {num_keyframes} keyframes per clip."""}]
+    for item in pending:
+        frame_times = [item["duration"] * i / (num_frames - 1) for i in range(num_frames)]
+        content.append({"type": "text", "text": (
+            f"CLIP {item['rank']}: {item['duration']:.1f} seconds long, "
+            f"frames at [{', '.join([f'{t:.1f}s' for t in frame_times])}]"
+        )})
+        for t, b64 in zip(frame_times, frames_to_base64(item["frames"])):
+            content.append({"type": "text", "text": f"Clip {item['rank']} frame ({t:.1f}s):"})
+            content.append({"type": "image_url", "image_url": {"url": f"data:image/webp;base64,{b64}"}})
+    
+    print(f"[VideoAnalyzer] Analyzing {len(pending)} clips in one request")
+    data = request_keyframes(content, BATCH_KEYFRAME_INSTRUCTIONS, timeout=120, expected_key="clips")
+    
+    returned = {}
+    for entry in (data or {}).get("clips", []):
+        try:
+            returned[int(entry["rank"])] = entry.get("keyframes", [])
+        except (KeyError, TypeError, ValueError):
+            continue
+    
+    for item in pending:
+        valid_keyframes = clean_keyframes(returned.get(item["rank"], []), item["duration"])
+        if valid_keyframes:
+            if item["cache_key"]:
+                cache_keyframes(item["cache_key"], item["hashes"], valid_keyframes)
+            results[item["rank"]] = valid_keyframes
+        else:
+            # Default: single keyframe at center
+            results[item["rank"]] = [{"time": 0, "cropX": 0.5}]
+    
+    return results
+
+
 def analyze_video_with_llm(video_path: str) -> dict:
     """
     Analyze video to get optimal face tracking parameters.
@@ -199,17 +388,17 @@ Be conservative (higher values) if background has many false positive triggers."
 
     content = [{"type": "text", "text": prompt}]
     for b64 in encoded_frames:
-        content.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}})
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/webp;base64,{b64}"}})
     
     try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
+        response = openrouter_post(
+            VISION_MODEL,
             headers={
                 "Authorization": f"Bearer {os.getenv('OPENROUTER_API_KEY')}",
                 "Content-Type": "application/json"
             },
             json={
-                "model": "anthropic/claude-sonnet-4",
+                "model": VISION_MODEL,
                 "messages": [{"role": "user", "content": content}],
                 "temperature": 0.2
             },
@@ -219,18 +408,10 @@ Be conservative (higher values) if background has many false positive triggers."
         result = response.json()
         response_text = result["choices"][0]["message"]["content"]
         
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
-        
-        import re
-        match = re.search(r'\{[\s\S]*\}', response_text)
-        if match:
-            params = json.loads(match.group())
-            validated = validate_params(params)
-            print(f"[VideoAnalyzer] LLM tuned params: {validated}")
-            return validated
+        params = parse_json_safely(response_text)
+        validated = validate_params(params)
+        print(f"[VideoAnalyzer] LLM tuned params: {validated}")
+        return validated
             
     except Exception as e:
         print(f"[VideoAnalyzer] LLM analysis failed: {e}")
@@ -446,74 +446,137 @@ export default function Home() {
     setClips([]);
     setUploadProgress(0);
 
+    // Set once the multipart upload exists, so a failure can abort it
+    let pendingUpload: { s3_key: string; upload_id: string } | null = null;
+
     try {
-      // Step 1: Get presigned URL from backend
+      // Step 1: Start a multipart upload
       const contentType = file.type || "video/mp4";
-      const urlRes = await fetch(`${API_URL}/get-upload-url`, {
+      const urlRes = await fetch(`${API_URL}/get-upload-urls`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ filename: file.name, content_type: contentType }),
+        body: JSON.stringify({ filename: file.name, content_type: contentType, file_size: file.size }),
       });
-      const { upload_url, s3_key, content_type } = await urlRes.json();
+      if (!urlRes.ok) {
+        throw new Error("Failed to start upload");
+      }
+      const { upload_id, s3_key, part_size, part_count } = await urlRes.json();
+      pendingUpload = { s3_key, upload_id };
 
-      // Step 2: Upload directly to S3 with progress tracking and retry
+      // Step 2: Upload parts directly to S3, several at once, retrying each part
       const maxRetries = 3;
-      let attempt = 0;
-      
-      while (attempt < maxRetries) {
-        attempt++;
-        setProgress(attempt > 1 ? `Retrying upload (attempt ${attempt}/${maxRetries})...` : "Uploading to S3...");
-        const uploadStart = Date.now();
-        
-        try {
-          await new Promise<void>((resolve, reject) => {
-            const xhr = new XMLHttpRequest();
-            xhr.timeout = 0;
-            
-            xhr.upload.addEventListener("progress", (e) => {
-              if (e.lengthComputable && e.loaded > 0) {
-                const percent = Math.round((e.loaded / e.total) * 100);
-                setUploadProgress(percent);
-                const elapsed = (Date.now() - uploadStart) / 1000;
-                const speed = e.loaded / elapsed;
-                const remaining = Math.ceil((e.total - e.loaded) / speed);
-                const mins = Math.floor(remaining / 60);
-                const secs = remaining % 60;
-                const eta = mins > 0 ? `~${mins}m ${secs}s` : `~${secs}s`;
-                const retryText = attempt > 1 ? ` [retry ${attempt}]` : "";
-                setProgress(`Uploading... ${percent}% (${eta} remaining)${retryText}`);
-              }
-            });
-            
-            xhr.addEventListener("load", () => {
-              if (xhr.status >= 200 && xhr.status < 300) {
-                resolve();
-              } else {
-                reject(new Error(`Status ${xhr.status}`));
-              }
-            });
-            
-            xhr.addEventListener("error", () => reject(new Error("Network error")));
-            xhr.addEventListener("abort", () => reject(new Error("Aborted")));
-            
-            xhr.open("PUT", upload_url);
-            xhr.setRequestHeader("Content-Type", content_type);
-            xhr.send(file);
+      const concurrency = 4;
+      const urlBatchSize = 20;
+      const loadedPerPart: number[] = new Array(part_count).fill(0);
+      const uploadStart = Date.now();
+      setProgress("Uploading to S3...");
+
+      const reportProgress = () => {
+        const loaded = loadedPerPart.reduce((sum, n) => sum + n, 0);
+        const percent = Math.round((loaded / file.size) * 100);
+        setUploadProgress(percent);
+        const elapsed = (Date.now() - uploadStart) / 1000;
+        const speed = loaded / elapsed;
+        const remaining = Math.ceil((file.size - loaded) / speed);
+        const mins = Math.floor(remaining / 60);
+        const secs = remaining % 60;
+        const eta = mins > 0 ? `~${mins}m ${secs}s` : `~${secs}s`;
+        setProgress(`Uploading... ${percent}% (${eta} remaining)`);
+      };
+
+      // Part URLs are presigned in batches just before they're needed, so they can't expire mid-upload
+      const partUrls: string[] = new Array(part_count);
+      const getPartUrls = async (index: number, count: number) => {
+        const res = await fetch(`${API_URL}/get-part-urls`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ s3_key, upload_id, first_part: index + 1, count }),
+        });
+        if (!res.ok) {
+          throw new Error("Failed to get upload URLs");
+        }
+        const { part_urls } = await res.json();
+        part_urls.forEach((url: string, i: number) => {
+          partUrls[index + i] = url;
+        });
+      };
+
+      const uploadPart = (index: number, url: string) =>
+        new Promise<string>((resolve, reject) => {
+          const xhr = new XMLHttpRequest();
+          xhr.timeout = 0;
+
+          xhr.upload.addEventListener("progress", (e) => {
+            if (e.lengthComputable && e.loaded > 0) {
+              loadedPerPart[index] = e.loaded;
+              reportProgress();
+            }
           });
-          break; // Success, exit retry loop
-        } catch (err) {
-          if (attempt >= maxRetries) {
-            throw new Error(`Upload failed after ${maxRetries} attempts. Check your connection and try again.`);
+
+          xhr.addEventListener("load", () => {
+            // Requires the bucket CORS config to expose the ETag header
+            const etag = xhr.getResponseHeader("ETag");
+            if (xhr.status >= 200 && xhr.status < 300 && etag) {
+              resolve(etag);
+            } else {
+              reject(new Error(`Status ${xhr.status}`));
+            }
+          });
+
+          xhr.addEventListener("error", () => reject(new Error("Network error")));
+          xhr.addEventListener("abort", () => reject(new Error("Aborted")));
+
+          xhr.open("PUT", url);
+          xhr.send(file.slice(index * part_size, (index + 1) * part_size));
+        });
+
+      const uploadPartWithRetry = async (index: number): Promise<string> => {
+        for (let attempt = 1; ; attempt++) {
+          try {
+            // Retries get a fresh URL in case the previous one expired
+            if (!partUrls[index] || attempt > 1) {
+              await getPartUrls(index, attempt > 1 ? 1 : Math.min(urlBatchSize, part_count - index));
+            }
+            return await uploadPart(index, partUrls[index]);
+          } catch (err) {
+            loadedPerPart[index] = 0;
+            if (attempt >= maxRetries) {
+              throw new Error(`Upload failed after ${maxRetries} attempts. Check your connection and try again.`);
+            }
+            setProgress(`Part ${index + 1} failed, retrying in 3s... (attempt ${attempt}/${maxRetries})`);
+            await new Promise(r => setTimeout(r, 3000));
           }
-          setProgress(`Upload failed, retrying in 3s... (attempt ${attempt}/${maxRetries})`);
-          await new Promise(r => setTimeout(r, 3000));
-          setUploadProgress(0);
         }
+      };
+
+      const etags: string[] = new Array(part_count);
+      let nextPart = 0;
+      const uploadWorker = async () => {
+        while (nextPart < part_count) {
+          const index = nextPart++;
+          etags[index] = await uploadPartWithRetry(index);
+        }
+      };
+      await Promise.all(Array.from({ length: Math.min(concurrency, part_count) }, uploadWorker));
+
+      // Step 3: Assemble the parts into the final object
+      const completeRes = await fetch(`${API_URL}/complete-upload`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          s3_key,
+          upload_id,
+          parts: etags.map((etag, i) => ({ ETag: etag, PartNumber: i + 1 })),
+        }),
+      });
+      if (!completeRes.ok) {
+        throw new Error("Failed to finalize upload");
       }
+      pendingUpload = null;
 
       setProgress("Upload complete! Starting analysis...");
 
-      // Step 3: Tell backend to process the S3 file
+      // Step 4: Tell backend to process the S3 file
       const analyzeRes = await fetch(`${API_URL}/analyze`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -525,6 +588,14 @@ export default function Home() {
       setStatus("processing");
       pollStatus(data.job_id);
     } catch (err) {
+      if (pendingUpload) {
+        // Best effort: discard the uploaded parts (the bucket lifecycle rule catches anything missed)
+        fetch(`${API_URL}/abort-upload`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify(pendingUpload),
+        }).catch(() => {});
+      }
       setStatus("failed");
       setProgress(err instanceof Error ? err.message : "Failed to upload");
       setIsProcessing(false);